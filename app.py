@@ -3,6 +3,7 @@
 import streamlit as st
 import numpy as np
 from PIL import Image
+import io
 import os
 
 # Import our custom modules
@@ -32,34 +33,44 @@ st.markdown(
         color: #388E3C;
         margin-bottom: 1rem;
     }
-    .pest-card {
-        background-color: #F1F8E9;
-        padding: 1rem;
-        border-radius: 10px;
-        margin: 0.5rem 0;
-        border-left: 5px solid #4CAF50;
-    }
-    .pesticide-card {
-        background-color: #E3F2FD;
-        padding: 1rem;
-        border-radius: 10px;
-        margin: 0.5rem 0;
-        border-left: 5px solid #2196F3;
-    }
-    .no-pest-card {
-        background-color: #FFF3E0;
-        padding: 1rem;
-        border-radius: 10px;
-        margin: 0.5rem 0;
-        border-left: 5px solid #FF9800;
-        text-align: center;
-    }
     </style>
     """,
     unsafe_allow_html=True
 )
 
 
+@st.cache_resource
+def get_detector():
+    """Load the pest detector once per server process"""
+    return PestDetector()
+
+
+@st.cache_resource
+def get_recommender():
+    """Load the pesticide recommender once per server process"""
+    return PesticideRecommender()
+
+
+@st.cache_data(show_spinner=False, max_entries=64)  # Bound server memory across sessions
+def _detect_cached(image_bytes, confidence_threshold=0.3):
+    """Detect pests in an uploaded image, cached on the raw upload bytes"""
+    detector = get_detector()
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("RGB", (512, 512))  # Let libjpeg decode large photos at reduced scale
+    detection_result = detector.detect_pest(image, confidence_threshold=confidence_threshold)
+
+    # Keep the annotated image as PNG bytes so the cached value stays small and picklable
+    detected_png = None
+    if detection_result["pest_detected"]:
+        buffer = io.BytesIO()
+        detector.annotate(
+            image, detection_result["primary_pest"], detection_result["confidence"]
+        ).save(buffer, format="PNG")
+        detected_png = buffer.getvalue()
+
+    return detection_result, detected_png
+
+
 class PestDetectionApp:
     def __init__(self):
         self.detector = None
@@ -69,8 +80,8 @@ class PestDetectionApp:
     def initialize_components(self):
         """Initialize detector and recommender"""
         try:
-            self.detector = PestDetector()
-            self.recommender = PesticideRecommender()
+            self.detector = get_detector()
+            self.recommender = get_recommender()
             return True
         except Exception as e:
             st.error(f"Error initializing components: {e}")
@@ -114,13 +125,15 @@ class PestDetectionApp:
             with col1:
                 st.markdown('<h2 class="sub-header">📷 Uploaded Image</h2>', unsafe_allow_html=True)
                 image = Image.open(uploaded_file)
+                image.draft("RGB", (512, 512))  # Preview does not need full resolution
+                image.load()
                 st.image(image, caption="Uploaded Image", use_column_width=True)
 
             with col2:
                 st.markdown('<h2 class="sub-header">🔍 Detection Results</h2>', unsafe_allow_html=True)
 
                 if st.button("🚀 Detect Pest", type="primary"):
-                    self.process_image(image)
+                    self.process_image(uploaded_file)
 
             # Instructions
             with st.expander("📋 How to Use This System"):
@@ -140,31 +153,26 @@ class PestDetectionApp:
                     """
                 )
 
-    def process_image(self, image):
+    def process_image(self, uploaded_file):
         """Process uploaded image and display results"""
         with st.spinner("🔍 Analyzing image for pests..."):
-            detection_result = self.detector.detect_pest(image, confidence_threshold=0.3)
+            detection_result, detected_png = _detect_cached(uploaded_file.getvalue(), confidence_threshold=0.3)
 
         if detection_result["pest_detected"]:
-            self.display_pest_detected(detection_result, image)
+            self.display_pest_detected(detection_result, detected_png)
         else:
             self.display_no_pest_detected()
 
-    def display_pest_detected(self, detection_result, original_image):
+    def display_pest_detected(self, detection_result, detected_png):
         """Display pest detection results"""
         primary_pest = detection_result["primary_pest"]
         confidence = detection_result["confidence"]
 
-        st.markdown(
-            f"""
-            <div class="pest-card">
-                <h3>🐛 Pest Detected!</h3>
-                <p><strong>Primary Pest:</strong> {primary_pest.title()}</p>
-                <p><strong>Confidence:</strong> {confidence:.1%}</p>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+        with st.container(border=True):
+            st.subheader("🐛 Pest Detected!")
+            col1, col2 = st.columns(2)
+            col1.metric("Primary Pest", primary_pest.title())
+            col2.metric("Confidence", f"{confidence:.1%}")
 
         # All predictions
         st.markdown("### 🔎 All Predictions")
@@ -174,24 +182,17 @@ class PestDetectionApp:
 
         # Visualization
         st.markdown("### 📸 Detection Visualization")
-        detected_image = self.detector.draw_detection_box(original_image, detection_result)
-        st.image(detected_image, caption="Detected Pest Location", use_column_width=True)
+        st.image(detected_png, caption="Detected Pest Location", use_column_width=True)
 
         # Recommendations
         self.display_pesticide_recommendations(primary_pest)
 
     def display_no_pest_detected(self):
         """Display no pest detected message"""
-        st.markdown(
-            """
-            <div class="no-pest-card">
-                <h3>✅ No Pest Detected</h3>
-                <p>The system didn't detect any pests in this image with sufficient confidence.</p>
-                <p><em>Your crops appear to be healthy! 🌱</em></p>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+        with st.container(border=True):
+            st.subheader("✅ No Pest Detected")
+            st.write("The system didn't detect any pests in this image with sufficient confidence.")
+            st.write("*Your crops appear to be healthy! 🌱*")
 
         st.info(
             """
@@ -217,18 +218,13 @@ class PestDetectionApp:
                     "High": "🟢",
                     "Medium": "🟡",
                     "Low": "🔴"
-                }.get(rec["effectiveness"], "⚪")
+                }.get(rec.get("effectiveness"), "⚪")
 
-                st.markdown(
-                    f"""
-                    <div class="pesticide-card">
-                        <h4>{i}. {rec['pesticide_name']}</h4>
-                        <p><strong>Application Rate:</strong> {rec['application_rate']}</p>
-                        <p><strong>Effectiveness:</strong> {emoji} {rec['effectiveness']}</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+                with st.container(border=True):
+                    st.subheader(f"{i}. {rec['pesticide']}")
+                    col1, col2 = st.columns(2)
+                    col1.metric("Application Rate", rec.get("application_rate", "N/A"))
+                    col2.metric("Effectiveness", f"{emoji} {rec.get('effectiveness', 'N/A')}")
 
             st.warning(
                 """
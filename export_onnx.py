@@ -0,0 +1,81 @@
+# export_onnx.py
+
+import os
+import random
+import numpy as np
+import tensorflow as tf
+import tf2onnx
+import onnxruntime as ort
+from PIL import Image
+from model_utils import float32_copy  # Also registers JitCompiled for load_model
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+
+class ValCalibrationReader(CalibrationDataReader):
+    """Feed preprocessed validation images to the INT8 calibrator"""
+
+    def __init__(self, input_name, val_dir="processed_data/val", num_images=100, target_size=(224, 224)):
+        paths = [
+            os.path.join(root, file)
+            for root, _, files in os.walk(val_dir)
+            for file in files
+            if file.lower().endswith((".png", ".jpg", ".jpeg"))
+        ]
+        random.Random(42).shuffle(paths)
+
+        self.input_name = input_name
+        self.target_size = target_size
+        self.paths = iter(paths[:num_images])
+
+    def get_next(self):
+        path = next(self.paths, None)
+        if path is None:
+            return None
+
+        img = Image.open(path).convert("RGB").resize(self.target_size, Image.BILINEAR)
+        arr = np.asarray(img, dtype=np.float32) / 255.0
+        return {self.input_name: arr[None, ...]}
+
+
+def export_onnx(keras_path="models/pest_detection_model.keras",
+                onnx_path="models/pest_detection_model.onnx",
+                opset=17, model=None):
+    """Convert the trained Keras model (or an in-memory `model`) to ONNX for ONNX Runtime inference"""
+    if model is None:
+        if not os.path.exists(keras_path):
+            raise FileNotFoundError(f"Model not found at {keras_path}")
+        model = tf.keras.models.load_model(keras_path)
+
+    tf2onnx.convert.from_keras(float32_copy(model), opset=opset, output_path=onnx_path)
+
+    print(f"✅ Exported ONNX model to {onnx_path}")
+    return onnx_path
+
+
+def quantize_onnx(onnx_path="models/pest_detection_model.onnx",
+                  int8_path="models/pest_detection_model.int8.onnx",
+                  val_dir="processed_data/val"):
+    """Statically quantize the ONNX model to INT8 using validation images for calibration"""
+    if not os.path.exists(val_dir):
+        print(f"⚠️ Skipping INT8 quantization, no calibration data at {val_dir}")
+        return None
+
+    input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    quantize_static(
+        onnx_path,
+        int8_path,
+        ValCalibrationReader(input_name, val_dir),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+
+    print(f"✅ Exported INT8 model to {int8_path}")
+    return int8_path
+
+
+if __name__ == "__main__":
+    export_onnx()
+    quantize_onnx()
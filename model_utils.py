@@ -0,0 +1,49 @@
+# model_utils.py
+
+import tensorflow as tf
+
+
+@tf.keras.utils.register_keras_serializable(package="pest_detection")
+class JitCompiled(tf.keras.layers.Layer):
+    """Run a wrapped layer or model under XLA while training"""
+
+    def __init__(self, inner, **kwargs):
+        super().__init__(**kwargs)
+        self.inner = inner
+        self._jit_call = tf.function(self._call_inner, jit_compile=True)
+
+    def _call_inner(self, inputs, training):
+        return self.inner(inputs, training=training)
+
+    def call(self, inputs, training=None):
+        # Inference and export trace the plain layer, so converters never see XLA clusters
+        if training:
+            return self._jit_call(inputs, training=True)
+        return self.inner(inputs, training=training)
+
+    def compute_output_shape(self, input_shape):
+        return self.inner.compute_output_shape(input_shape)
+
+    def get_config(self):
+        config = super().get_config()
+        config["inner"] = tf.keras.utils.serialize_keras_object(self.inner)
+        return config
+
+    @classmethod
+    def from_config(cls, config):
+        config["inner"] = tf.keras.utils.deserialize_keras_object(config["inner"])
+        return cls(**config)
+
+
+def float32_copy(model):
+    """Rebuild a (possibly mixed precision) model with float32 layers and the same weights"""
+    config = model.to_json()
+    if "mixed_float16" not in config:
+        return model
+
+    # Layers carry their own dtype policy in the config, so rewrite it there; mixed precision
+    # graphs would otherwise export float16 Cast/Conv nodes that CPU runtimes and INT8
+    # calibration handle poorly
+    copy = tf.keras.models.model_from_json(config.replace('"mixed_float16"', '"float32"'))
+    copy.set_weights(model.get_weights())
+    return copy
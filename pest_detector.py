@@ -2,17 +2,48 @@
 
 import os
 import json
-import cv2
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+from PIL import Image, ImageDraw
 
 class PestDetector:
-    def __init__(self, model_path="models/pest_detection_model.h5", mapping_path="processed_data/class_mapping.json"):
-        # Load trained model
+    def __init__(self, model_path="models/pest_detection_model.onnx", mapping_path="processed_data/class_mapping.json",
+                 prefer_int8=True, trt_cache_path="models/trt_cache", batch_window=0.01, max_batch=32):
+        # Import lazily so loading this module stays cheap until a detector is built
+        import onnxruntime as ort
+
+        # Load trained model (export with `python export_onnx.py`)
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model not found at {model_path}")
-        self.model = load_model(model_path)
+
+        # Use the INT8 quantized model when one has been exported next to the FP32 model
+        int8_path = os.path.splitext(model_path)[0] + ".int8.onnx"
+        if prefer_int8 and os.path.exists(int8_path):
+            model_path = int8_path
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = os.cpu_count()
+        so.enable_cpu_mem_arena = True
+        so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+
+        # Prefer TensorRT (FP16, engines cached on disk) on GPU machines, then CUDA, then CPU
+        available = ort.get_available_providers()
+        providers = []
+        if "TensorrtExecutionProvider" in available:
+            os.makedirs(trt_cache_path, exist_ok=True)
+            providers.append(("TensorrtExecutionProvider", {
+                "trt_fp16_enable": True,
+                "trt_engine_cache_enable": True,
+                "trt_engine_cache_path": trt_cache_path
+            }))
+        providers += [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        self.session = ort.InferenceSession(model_path, sess_options=so, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
 
         # Load class mapping
         if not os.path.exists(mapping_path):
@@ -23,23 +54,97 @@ class PestDetector:
         # Reverse mapping: index → pest name
         self.idx_to_class = {v: k for k, v in self.class_mapping.items()}
 
+        # Single images always have shape (1, 224, 224, 3), so bind fixed input/output
+        # buffers once and skip per-call allocation and feed conversion
+        self._single_input = np.empty((1, 224, 224, 3), dtype=np.float32)
+        self._single_output = np.empty((1, len(self.class_mapping)), dtype=np.float32)
+        self._single_binding = self.session.io_binding()
+        self._single_binding.bind_ortvalue_input(
+            self.input_name, ort.OrtValue.ortvalue_from_numpy(self._single_input))
+        self._single_binding.bind_ortvalue_output(
+            self.session.get_outputs()[0].name, ort.OrtValue.ortvalue_from_numpy(self._single_output))
+
+        # One detector serves every Streamlit session, so single-image requests are queued and
+        # a worker coalesces those arriving within `batch_window` seconds into one session run
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._requests = queue.Queue()
+        threading.Thread(target=self._serve_requests, daemon=True).start()
+
         print(f"✅ Model loaded from {model_path}")
         print(f"✅ Loaded {len(self.class_mapping)} pest classes")
 
-    def preprocess_image(self, img_path, target_size=(224, 224)):
-        """Load and preprocess image for prediction"""
-        if not os.path.exists(img_path):
-            raise FileNotFoundError(f"Image not found: {img_path}")
-
-        img = image.load_img(img_path, target_size=target_size)
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0) / 255.0  # Normalize
-        return img_array
+    def load_image(self, img, target_size=(224, 224)):
+        """Open an image path (or take a PIL image) and resize it to the model input size"""
+        if not isinstance(img, Image.Image):
+            if not os.path.exists(img):
+                raise FileNotFoundError(f"Image not found: {img}")
+            img = Image.open(img)
+
+        return img.convert("RGB").resize(target_size, Image.BILINEAR)
+
+    def preprocess_image(self, img, target_size=(224, 224)):
+        """Load and preprocess an image path or PIL image for prediction"""
+        img_array = np.asarray(self.load_image(img, target_size), dtype=np.float32)
+        img_array *= np.float32(1.0 / 255.0)  # Normalize in place
+        return img_array[None, ...]
+
+    def preprocess_images(self, imgs, target_size=(224, 224), out=None):
+        """Preprocess several images into one (N, H, W, 3) float32 batch, reusing `out` if given"""
+        if out is None:
+            out = np.empty((len(imgs), *target_size, 3), dtype=np.float32)
+
+        batch = out[:len(imgs)]
+        for i, img in enumerate(imgs):
+            batch[i] = np.asarray(self.load_image(img, target_size))
+        batch *= np.float32(1.0 / 255.0)
+        return batch
+
+    def predict_single(self, img):
+        """Predict one image, batched with any concurrent requests from other sessions"""
+        future = Future()
+        self._requests.put((np.asarray(self.load_image(img)), future))
+        return future.result()
+
+    def _serve_requests(self):
+        """Collect queued requests for up to `batch_window` seconds and run them together"""
+        while True:
+            pending = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(pending) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self._requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                predictions = self._run_pixels([pixels for pixels, _ in pending])
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), scores in zip(pending, predictions):
+                future.set_result(scores)
+
+    def _run_pixels(self, pixel_arrays):
+        """Run decoded uint8 images through the session (only called from the worker thread)"""
+        if len(pixel_arrays) == 1:
+            # Lone requests go through the pre-bound (1, 224, 224, 3) buffers
+            np.multiply(pixel_arrays[0], np.float32(1.0 / 255.0), out=self._single_input[0])
+            self.session.run_with_iobinding(self._single_binding)
+            return [self._single_output[0].copy()]
+
+        batch = np.stack(pixel_arrays).astype(np.float32)
+        batch *= np.float32(1.0 / 255.0)
+        return list(self.session.run(None, {self.input_name: batch})[0])
 
     def predict_pest(self, img_path):
         """Predict pest class from image"""
-        processed_img = self.preprocess_image(img_path)
-        predictions = self.model.predict(processed_img, verbose=0)[0]
+        predictions = self.predict_single(img_path)
 
         # Get best prediction
         class_idx = np.argmax(predictions)
@@ -48,18 +153,72 @@ class PestDetector:
 
         return pest_name, float(confidence)
 
-    def visualize_prediction(self, img_path, pest_name, confidence):
-        """Draw prediction result on image"""
-        img = cv2.imread(img_path)
-        if img is None:
-            raise ValueError(f"Unable to read image: {img_path}")
+    def predict_pests(self, img_paths, batch_size=32, num_workers=4):
+        """Predict pest classes for many images, one session run per batch"""
+        results = []
+        if not img_paths:
+            return results
+
+        chunks = [img_paths[start:start + batch_size] for start in range(0, len(img_paths), batch_size)]
+        num_workers = max(1, min(num_workers, os.cpu_count() or 1, len(chunks)))
+
+        # Each in-flight chunk owns a buffer, plus one for the batch being inferred
+        buffers = [
+            np.empty((min(batch_size, len(img_paths)), 224, 224, 3), dtype=np.float32)
+            for _ in range(num_workers + 1)
+        ]
+
+        # Decode upcoming chunks in worker threads while the session runs the current one
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            pending = deque(
+                pool.submit(self.preprocess_images, chunks[i], out=buffers[i % len(buffers)])
+                for i in range(num_workers)
+            )
+
+            for i in range(len(chunks)):
+                batch = pending.popleft().result()
+
+                next_chunk = i + num_workers
+                if next_chunk < len(chunks):
+                    pending.append(pool.submit(
+                        self.preprocess_images, chunks[next_chunk], out=buffers[next_chunk % len(buffers)]
+                    ))
+
+                predictions = self.session.run(None, {self.input_name: batch})[0]
+
+                class_idxs = np.argmax(predictions, axis=1)
+                for class_idx, scores in zip(class_idxs, predictions):
+                    results.append((self.idx_to_class.get(class_idx, "Unknown"), float(scores[class_idx])))
+
+        return results
+
+    def detect_pest(self, img, confidence_threshold=0.5):
+        """Run detection on an image path or PIL image and summarise all class scores"""
+        predictions = self.predict_single(img)
+
+        all_predictions = [
+            {"class": self.idx_to_class.get(idx, "Unknown"), "confidence": float(predictions[idx])}
+            for idx in np.argsort(predictions)[::-1]
+        ]
+        best = all_predictions[0]
+
+        return {
+            "pest_detected": best["confidence"] >= confidence_threshold,
+            "primary_pest": best["class"],
+            "confidence": best["confidence"],
+            "all_predictions": all_predictions
+        }
+
+    def annotate(self, pil_img, pest_name, confidence):
+        """Outline the image and label it with the predicted pest"""
+        pil_img = pil_img.convert("RGB")
+        draw = ImageDraw.Draw(pil_img)
 
         text = f"{pest_name} ({confidence:.2f})"
-        cv2.putText(img, text, (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.imshow("Pest Detection", img)
-        cv2.waitKey(0)
-        cv2.destroyAllWindows()
+        draw.rectangle((0, 0, pil_img.width - 1, pil_img.height - 1), outline=(0, 255, 0),
+                       width=max(2, pil_img.width // 200))
+        draw.text((10, 30), text, fill=(0, 255, 0))
+        return pil_img
 
 if __name__ == "__main__":
     detector = PestDetector()
@@ -71,4 +230,4 @@ if __name__ == "__main__":
     print(f"🔍 Detected: {pest} with {conf:.2f} confidence")
 
     # Visualize result
-    detector.visualize_prediction(test_image, pest, conf)
+    detector.annotate(Image.open(test_image), pest, conf).show()
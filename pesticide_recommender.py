@@ -1,40 +1,68 @@
-import pandas as pd
 import os
+import glob
 import json
+import pickle
 
 
 class PesticideRecommender:
-    def __init__(self):
+    def __init__(self, index_path="data/pesticide_index.pkl"):
         self.pesticide_db = None
-        self.load_pesticide_database()
+        self._by_pest = {}
+        self.index_path = index_path
+        self.csv_file = self.find_csv_file("data/pestopia")
+
+        # Reuse the pickled index unless the CSV has changed since it was written
+        if not self.load_index():
+            self.load_pesticide_database()
+            self.build_index()
+            self.save_index()
 
     def load_pesticide_database(self):
         """Load and process pesticide database from Pestopia dataset"""
+        import pandas as pd  # Deferred to keep app start-up fast
 
-        pestopia_path = "data/pestopia"
-        csv_files = []
-
-        if os.path.exists(pestopia_path):
-            for root, dirs, files in os.walk(pestopia_path):
-                for file in files:
-                    if file.endswith(".csv"):
-                        csv_files.append(os.path.join(root, file))
-
-        if csv_files:
+        if self.csv_file:
             # Load the first CSV file found
             try:
-                self.pesticide_db = pd.read_csv(csv_files[0])
-                print(f"✅ Loaded pesticide database from: {csv_files[0]}")
+                self.pesticide_db = pd.read_csv(self.csv_file)
+                print(f"✅ Loaded pesticide database from: {self.csv_file}")
                 print(f"Columns: {list(self.pesticide_db.columns)}")
             except Exception as e:
                 print(f"⚠️ Error loading database: {e}")
+                self.csv_file = None  # The default database is not backed by this CSV
                 self.create_default_database()
         else:
             print("⚠️ No CSV file found, creating default database")
             self.create_default_database()
 
+    def find_csv_file(self, pestopia_path):
+        """Find the first CSV file in the Pestopia dataset, remembering it in a sidecar file"""
+
+        cache_path = os.path.join(pestopia_path, ".csv_cache")
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r") as f:
+                    csv_file = json.load(f).get("csv_file")
+                if csv_file and os.path.exists(csv_file):
+                    return csv_file
+            except (OSError, ValueError):
+                pass
+
+        pattern = os.path.join(pestopia_path, "**", "*.csv")
+        csv_file = next(glob.iglob(pattern, recursive=True), None)
+
+        if csv_file:
+            try:
+                with open(cache_path, "w") as f:
+                    json.dump({"csv_file": csv_file}, f)
+            except OSError as e:
+                print(f"⚠️ Could not cache CSV location: {e}")
+
+        return csv_file
+
     def create_default_database(self):
         """Create a default pesticide database if none found"""
+        import pandas as pd
 
         default_data = {
             "pest_name": [
@@ -99,13 +127,12 @@ class PesticideRecommender:
         print("✅ Created default pesticide database")
         print(f"Shape: {self.pesticide_db.shape}")
 
-    def get_recommendations(self, pest_name):
-        """Get pesticide recommendations for a specific pest"""
+    def build_index(self):
+        """Group recommendations by lowercased pest name so lookups skip pandas"""
 
+        self._by_pest = {}
         if self.pesticide_db is None:
-            return []
-
-        pest_name_clean = pest_name.lower().strip()
+            return
 
         # Handle both possible column names
         pest_col = None
@@ -117,40 +144,83 @@ class PesticideRecommender:
                 pesticide_col = col
         if pest_col is None or pesticide_col is None:
             print("❌ Could not find required columns in pesticide database.")
-            return []
+            return
+
+        # Always include pest name and pesticide info, plus extra info if present
+        columns = [pest_col, pesticide_col]
+        columns += [col for col in ["application_rate", "effectiveness"] if col in self.pesticide_db.columns]
+        records = self.pesticide_db[columns].rename(columns={pest_col: "pest_name", pesticide_col: "pesticide"})
+
+        pest_keys = self.pesticide_db[pest_col].astype(str).str.lower().str.strip()
+        self._by_pest = {
+            key: group.to_dict(orient="records")
+            for key, group in records.groupby(pest_keys, sort=False)
+        }
+
+    def load_index(self):
+        """Load the pickled recommendation index if it is newer than the source CSV"""
+
+        if not self.csv_file or not os.path.exists(self.index_path):
+            return False
+        if os.path.getmtime(self.index_path) < os.path.getmtime(self.csv_file):
+            return False
+
+        try:
+            with open(self.index_path, "rb") as f:
+                index = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Error loading pesticide index: {e}")
+            return False
+
+        if index.get("csv_file") != self.csv_file:
+            return False
+
+        self._by_pest = index["by_pest"]
+        print(f"✅ Loaded pesticide index from: {self.index_path}")
+        return True
+
+    def save_index(self):
+        """Pickle the recommendation index so later runs can skip parsing the CSV"""
+
+        # The default database is cheap to rebuild, so only CSV-backed indexes are cached
+        if not self.csv_file or self.pesticide_db is None or not self._by_pest:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            with open(self.index_path, "wb") as f:
+                pickle.dump({"csv_file": self.csv_file, "by_pest": self._by_pest}, f, protocol=5)
+        except OSError as e:
+            print(f"⚠️ Could not save pesticide index: {e}")
+
+    def get_recommendations(self, pest_name):
+        """Get pesticide recommendations for a specific pest"""
+
+        pest_name_clean = pest_name.lower().strip()
 
         # Direct match
-        matches = self.pesticide_db[
-            self.pesticide_db[pest_col].str.lower().str.contains(pest_name_clean, na=False)
-        ]
-
-        # If no direct matches, try partial
-        if matches.empty:
-            for pest in self.pesticide_db[pest_col].unique():
-                if pest_name_clean in str(pest).lower() or str(pest).lower() in pest_name_clean:
-                    matches = self.pesticide_db[self.pesticide_db[pest_col] == pest]
-                    break
+        recommendations = self._by_pest.get(pest_name_clean)
+        if recommendations is not None:
+            return list(recommendations)
 
-        # Convert to list of dicts, handling both CSV and default DB columns
+        # Pests whose name contains the query
         recommendations = []
-        for _, row in matches.iterrows():
-            rec = {}
-            # Always include pest name and pesticide info
-            rec["pest_name"] = row[pest_col]
-            rec["pesticide"] = row[pesticide_col]
-            # Optionally include extra info if present
-            if "application_rate" in row:
-                rec["application_rate"] = row["application_rate"]
-            if "effectiveness" in row:
-                rec["effectiveness"] = row["effectiveness"]
-            recommendations.append(rec)
+        for pest, recs in self._by_pest.items():
+            if pest_name_clean in pest:
+                recommendations.extend(recs)
+
+        # If still nothing, try a pest name contained in the query
+        if not recommendations:
+            for pest, recs in self._by_pest.items():
+                if pest in pest_name_clean:
+                    recommendations = list(recs)
+                    break
+
         return recommendations
 
     def get_all_pests(self):
         """Get list of all pests in database"""
-        if self.pesticide_db is not None:
-            return self.pesticide_db["pest_name"].unique().tolist()
-        return []
+        return [recs[0]["pest_name"] for recs in self._by_pest.values()]
 
 
 # 🔹 Test block
@@ -1,9 +1,12 @@
 # preprocess_data.py
 
 import os
+import re
+import errno
+import math
+import random
 import pandas as pd
 import shutil
-from sklearn.model_selection import train_test_split
 import json
 
 
@@ -11,13 +14,26 @@ class DataPreprocessor:
     def __init__(self):
         self.pest_classes = {}  # Maps pest name -> index
         self.class_mapping = {}  # Reserved for reverse mapping if needed
+        self.class_images = {}  # Maps pest name -> source image paths
+        self.class_counts = {}  # Maps pest name -> number of images written
+        self.dir_classes = {}  # Maps directory -> extracted pest class
+
+        self.pest_keywords = [
+            'aphid', 'thrips', 'whitefly', 'caterpillar', 'beetle',
+            'mite', 'leafhopper', 'scale', 'borer', 'weevil',
+            'armyworm', 'bollworm', 'cutworm', 'wireworm'
+        ]
+        self.pest_re = re.compile('|'.join(map(re.escape, self.pest_keywords)))
 
     def create_unified_dataset(self):
         """Combine datasets and create unified pest classes"""
         print("Creating unified dataset...")
 
+        # Start from empty splits; stale entries may be hardlinks into the original dataset
+        shutil.rmtree('processed_data/train', ignore_errors=True)
+        shutil.rmtree('processed_data/val', ignore_errors=True)
+
         # Create directories for processed data
-        os.makedirs('processed_data/images', exist_ok=True)
         os.makedirs('processed_data/train', exist_ok=True)
         os.makedirs('processed_data/val', exist_ok=True)
 
@@ -47,7 +63,7 @@ class DataPreprocessor:
                         pest_class = self.extract_pest_class(root)
                         print(f"Found file: {file}, pest_class: {pest_class}")
                         if pest_class:
-                            self.copy_image_with_class(
+                            self.add_image_with_class(
                                 os.path.join(root, file),
                                 pest_class
                             )
@@ -66,7 +82,7 @@ class DataPreprocessor:
                         pest_class = self.extract_pest_class(root)
                         print(f"Found file: {file}, pest_class: {pest_class}")
                         if pest_class:
-                            self.copy_image_with_class(
+                            self.add_image_with_class(
                                 os.path.join(root, file),
                                 pest_class
                             )
@@ -74,17 +90,17 @@ class DataPreprocessor:
             print(f"Path does not exist: {ag_pest_path}")
 
     def extract_pest_class(self, path):
-        """Extract pest class name from file path"""
-        pest_keywords = [
-            'aphid', 'thrips', 'whitefly', 'caterpillar', 'beetle',
-            'mite', 'leafhopper', 'scale', 'borer', 'weevil',
-            'armyworm', 'bollworm', 'cutworm', 'wireworm'
-        ]
-
-        path_lower = path.lower()
-        for keyword in pest_keywords:
-            if keyword in path_lower:
-                return keyword
+        """Extract pest class name from a directory path, cached per directory"""
+        if path not in self.dir_classes:
+            self.dir_classes[path] = self._match_pest_class(path)
+        return self.dir_classes[path]
+
+    def _match_pest_class(self, path):
+        """Match pest keywords against a path, falling back to the folder name"""
+        matches = set(self.pest_re.findall(path.lower()))
+        if matches:
+            # Keep keyword list order as the priority when several keywords appear
+            return min(matches, key=self.pest_keywords.index)
 
         # If no keyword found, use folder name
         folder_name = os.path.basename(path).lower()
@@ -93,50 +109,51 @@ class DataPreprocessor:
 
         return None
 
-    def copy_image_with_class(self, src_path, pest_class):
-        """Copy image to processed data with class label"""
+    def add_image_with_class(self, src_path, pest_class):
+        """Record a source image under its class label"""
         if pest_class not in self.pest_classes:
             self.pest_classes[pest_class] = len(self.pest_classes)
-
-        # Create class directory
-        class_dir = f'processed_data/images/{pest_class}'
-        os.makedirs(class_dir, exist_ok=True)
-
-        # Copy file with unique name
-        filename = f"{pest_class}_{len(os.listdir(class_dir))}.jpg"
-        dst_path = os.path.join(class_dir, filename)
-        print(f"Copying {src_path} to {dst_path}")
-        shutil.copy2(src_path, dst_path)
+            self.class_images[pest_class] = []
+            self.class_counts[pest_class] = 0
+
+        self.class_images[pest_class].append(src_path)
+
+    def link_image(self, src_path, pest_class, split):
+        """Hardlink an image into a split directory, copying if linking is not possible"""
+        filename = f"{pest_class}_{self.class_counts[pest_class]}.jpg"
+        self.class_counts[pest_class] += 1
+        dst_path = f'processed_data/{split}/{pest_class}/{filename}'
+
+        print(f"Linking {src_path} to {dst_path}")
+        try:
+            os.link(src_path, dst_path)
+        except OSError as e:
+            # Only copy for cross-device or unsupported filesystems; anything else (e.g. an
+            # existing dst) must not write through a hardlink into the source dataset
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP):
+                raise
+            shutil.copy2(src_path, dst_path)
 
     def create_train_val_split(self):
         """Create training and validation splits"""
-        for pest_class in self.pest_classes.keys():
-            class_path = f'processed_data/images/{pest_class}'
-            if os.path.exists(class_path):
-                images = os.listdir(class_path)
-
-                # Split 80% train, 20% validation
-                train_images, val_images = train_test_split(
-                    images, test_size=0.2, random_state=42
-                )
-
-                # Create class directories in train/val
-                os.makedirs(f'processed_data/train/{pest_class}', exist_ok=True)
-                os.makedirs(f'processed_data/val/{pest_class}', exist_ok=True)
-
-                # Copy training images
-                for img in train_images:
-                    shutil.copy2(
-                        os.path.join(class_path, img),
-                        f'processed_data/train/{pest_class}/{img}'
-                    )
-
-                # Copy validation images
-                for img in val_images:
-                    shutil.copy2(
-                        os.path.join(class_path, img),
-                        f'processed_data/val/{pest_class}/{img}'
-                    )
+        rng = random.Random(42)
+        for pest_class, images in self.class_images.items():
+            images = list(images)
+            rng.shuffle(images)
+
+            # Split 80% train, 20% validation
+            num_val = math.ceil(len(images) * 0.2)
+            val_images, train_images = images[:num_val], images[num_val:]
+
+            # Create class directories in train/val
+            os.makedirs(f'processed_data/train/{pest_class}', exist_ok=True)
+            os.makedirs(f'processed_data/val/{pest_class}', exist_ok=True)
+
+            for img in train_images:
+                self.link_image(img, pest_class, 'train')
+
+            for img in val_images:
+                self.link_image(img, pest_class, 'val')
 
     def save_class_mapping(self):
         """Save class mapping for later use"""
@@ -7,7 +7,7 @@ import time
 def check_requirements():
     """Check if all required files exist"""
     required_files = [
-        'models/pest_detection_model.h5',
+        'models/pest_detection_model.onnx',
         'processed_data/class_mapping.json',
         'app.py'
     ]
@@ -20,28 +20,42 @@ def check_requirements():
     return missing_files
 
 
+def stream_command(command):
+    """Run a command, echoing its combined output as it is produced"""
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, bufsize=1) as process:
+        for line in process.stdout:
+            print(line, end="")
+    return process.returncode
+
+
 def setup_system():
     """Set up the entire system from scratch"""
     print("\n🚀 Setting up Pest Detection System...")
 
+    # Interactive steps inherit the terminal; the rest are streamed line by line
     steps = [
-        ("📥 Downloading datasets...", "python download_datasets.py"),
-        ("🔄 Preprocessing data...", "python preprocess_data.py"),
-        ("🧠 Training model (this may take a while)...", "python train_model.py"),
-        ("🧪 Testing pesticide recommender...", "python pesticide_recommender.py"),
+        ("📥 Downloading datasets...", [sys.executable, "download_datasets.py"], True),
+        ("🔄 Preprocessing data...", [sys.executable, "preprocess_data.py"], False),
+        ("🧠 Training model (this may take a while)...", [sys.executable, "train_model.py"], True),
+        ("🧪 Testing pesticide recommender...", [sys.executable, "pesticide_recommender.py"], False),
     ]
 
-    for description, command in steps:
+    for description, command, interactive in steps:
         print(f"\n{description}")
         try:
-            result = subprocess.run(command.split(), capture_output=True, text=True)
-            if result.returncode == 0:
+            if interactive:
+                returncode = subprocess.run(command).returncode
+            else:
+                returncode = stream_command(command)
+
+            if returncode == 0:
                 print("✅ Success!")
             else:
-                print(f"❌ Error: {result.stderr}")
+                print(f"❌ Error: {' '.join(command)} exited with code {returncode}")
                 return False
         except Exception as e:
-            print(f"❌ Error executing {command}: {e}")
+            print(f"❌ Error executing {' '.join(command)}: {e}")
             return False
 
     return True
@@ -2,22 +2,49 @@
 
 import tensorflow as tf
 from tensorflow.keras import layers, models
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-import json
+import orjson
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import sys
+import random
+import shutil
+from pathlib import Path
+from model_utils import JitCompiled, float32_copy
+
+# Mixed precision uses Tensor Cores on GPU but is much slower on CPU, so only enable it there
+if tf.config.list_physical_devices("GPU"):
+    tf.keras.mixed_precision.set_global_policy("mixed_float16")
+
+
+class NpzCheckpoint(tf.keras.callbacks.Callback):
+    """Save a compressed weights-only checkpoint every few epochs"""
+
+    def __init__(self, path, every=2, target=None):
+        super().__init__()
+        self.path = path
+        self.every = every
+        # Model whose weights are saved; defaults to the model being fit
+        self.target = target
+
+    def on_epoch_end(self, epoch, logs=None):
+        if (epoch + 1) % self.every == 0:
+            model = self.target if self.target is not None else self.model
+            np.savez_compressed(self.path, *model.get_weights())
 
 
 class PestDetectionModel:
-    def __init__(self, input_shape=(224, 224, 3)):
+    def __init__(self, input_shape=(224, 224, 3), batch_size=80, epochs=8, profile=False):
         self.input_shape = input_shape
+        # Used for both the fit length and the cosine schedule length, so they cannot drift apart
+        self.epochs = epochs
+        self.profile = profile
         self.model = None
         self.history = None
+        # Tensor Core GEMMs need batch dimensions that are multiples of 8, so round up
+        self.batch_size = -(-batch_size // 8) * 8
 
         # Load class mapping
-        with open("processed_data/class_mapping.json", "r") as f:
-            self.class_mapping = json.load(f)
+        self.class_mapping = orjson.loads(Path("processed_data/class_mapping.json").read_bytes())
 
         self.num_classes = len(self.class_mapping)
         print(f"Training model for {self.num_classes} pest classes")
@@ -25,6 +52,27 @@ class PestDetectionModel:
     def create_model(self):
         """Create CNN model for pest detection using transfer learning"""
 
+        self.model, self.head, self.feature_extractor = self.build_network()
+
+        # Compile model. The random image transforms have no XLA kernels, so the full model's
+        # step is not jit-compiled; its head runs under XLA through JitCompiled instead
+        for model, jit_compile in ((self.model, False), (self.head, True)):
+            model.compile(
+                optimizer=self.create_optimizer(),
+                loss="categorical_crossentropy",
+                metrics=["accuracy"],
+                # Run 16 steps per tf.function call to amortize dispatch; profiling needs single
+                # steps, since batch hooks (and so the traced window) fire once per execution
+                steps_per_execution=1 if self.profile else 16,
+                jit_compile=jit_compile
+            )
+
+        print("✅ Model created successfully!")
+        self.model.summary()
+
+    def build_network(self):
+        """Build the full model, its classification head and the pooled feature extractor"""
+
         # Base model: MobileNetV2
         base_model = tf.keras.applications.MobileNetV2(
             input_shape=self.input_shape,
@@ -33,63 +81,127 @@ class PestDetectionModel:
         )
         base_model.trainable = False  # Freeze base layers
 
-        # Custom classification head (diamond shape)
-        self.model = models.Sequential([
-            base_model,
-            layers.GlobalAveragePooling2D(),
-            layers.Dropout(0.2),
-            layers.Dense(128, activation="relu"),
-            layers.Dropout(0.2),
+        inputs = layers.Input(shape=self.input_shape)
+
+        # Augmentation runs on the accelerator as part of the model and is a no-op at inference
+        x = layers.RandomFlip("horizontal")(inputs)
+        x = layers.RandomRotation(20 / 360)(x)
+        x = layers.RandomTranslation(0.2, 0.2)(x)
+        x = layers.RandomZoom(0.2)(x)
+
+        # Run the frozen base in inference mode so batch norm statistics are not updated
+        x = base_model(x, training=False)
+        x = layers.GlobalAveragePooling2D()(x)
+
+        # Custom classification head, kept as its own model so it can also be trained on
+        # cached base features (see precompute_embeddings)
+        head = models.Sequential([
+            layers.Input(shape=(x.shape[-1],)),
             layers.Dense(256, activation="relu"),
-            layers.Dropout(0.2),
-            layers.Dense(128, activation="relu"),
-            layers.Dense(self.num_classes, activation="softmax")
-        ])
-
-        # Compile model
-        self.model.compile(
-            optimizer="adam",
-            loss="categorical_crossentropy",
-            metrics=["accuracy"]
-        )
+            layers.BatchNormalization(),
+            layers.Dropout(0.3),
+            # Keep softmax in float32 for numerical stability under mixed precision
+            layers.Dense(self.num_classes, activation="softmax", dtype="float32")
+        ], name="head")
+        # Fuse the head's small Dense/BN/Dropout kernels with XLA inside the full model's step
+        outputs = JitCompiled(head, name="jit_head")(x)
 
-        print("✅ Model created successfully!")
-        self.model.summary()
+        model = models.Model(inputs, outputs)
+        feature_extractor = models.Sequential([base_model, layers.GlobalAveragePooling2D()])
+        return model, head, feature_extractor
 
-    def prepare_data(self):
-        """Prepare training and validation data with augmentation"""
-
-        # Data augmentation
-        train_datagen = ImageDataGenerator(
-            rescale=1.0 / 255,
-            rotation_range=20,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            horizontal_flip=True,
-            zoom_range=0.2
+    def create_optimizer(self):
+        """Create AdamW with a cosine LR schedule spanning the whole run"""
+
+        # Cosine decay over the whole run replaces plateau-based LR reduction
+        # (needs prepare_data() to have run so the schedule length is known)
+        steps_per_epoch = int(self.train_ds.cardinality())
+        learning_rate = tf.keras.optimizers.schedules.CosineDecay(
+            1e-3, decay_steps=steps_per_epoch * self.epochs, alpha=0.01
         )
+        optimizer = tf.keras.optimizers.AdamW(learning_rate=learning_rate, weight_decay=1e-4)
+        if tf.keras.mixed_precision.global_policy().name == "mixed_float16":
+            optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+        return optimizer
+
+    def prepare_data(self):
+        """Prepare training and validation tf.data pipelines"""
+
+        AUTOTUNE = tf.data.AUTOTUNE
+
+        # Keep label indices in class_mapping order so predictions map back to the right pest
+        class_names = sorted(self.class_mapping, key=self.class_mapping.get)
+
+        def load_split(directory):
+            paths, labels = [], []
+            for index, name in enumerate(class_names):
+                class_dir = os.path.join(directory, name)
+                if not os.path.isdir(class_dir):
+                    continue
+                files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith((".png", ".jpg", ".jpeg")))
+                paths += [os.path.join(class_dir, f) for f in files]
+                labels += [index] * len(files)
+
+            # Files are listed class by class, so mix them before the bounded shuffle buffer
+            order = list(range(len(paths)))
+            random.Random(42).shuffle(order)
+            paths = [paths[i] for i in order]
+            labels = [labels[i] for i in order]
+
+            def decode(path, label):
+                # Antialiased bilinear resize to match PIL's BILINEAR in PestDetector and calibration
+                image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+                image = tf.image.resize(image, self.input_shape[:2], antialias=True)
+                return tf.cast(tf.round(tf.clip_by_value(image, 0, 255)), tf.uint8), label
+
+            # Unbatched so the cached file holds single images that are reshuffled every epoch
+            return (
+                tf.data.Dataset.from_tensor_slices((paths, tf.one_hot(labels, len(class_names))))
+                .map(decode, num_parallel_calls=AUTOTUNE)
+            )
 
-        val_datagen = ImageDataGenerator(rescale=1.0 / 255)
+        # Decoded, resized images are cached on disk as uint8 during the first epoch, so later
+        # epochs read one sequential file instead of decoding every JPEG again. The cache is
+        # rebuilt on every run so it never serves images from an older preprocessing pass.
+        shutil.rmtree("cache", ignore_errors=True)
+        os.makedirs("cache", exist_ok=True)
 
-        # Create data generators
-        self.train_generator = train_datagen.flow_from_directory(
-            "processed_data/train",
-            target_size=self.input_shape[:2],
-            batch_size=40,  # increased from 32
-            class_mode="categorical"
+        # Explicitly float32: under mixed_float16 it would otherwise yield float16 images, which the
+        # float32 export graphs reject as calibration data
+        rescale = layers.Rescaling(1.0 / 255, dtype="float32")
+        batch_size = self.batch_size
+
+        train_files = load_split("processed_data/train")
+        val_files = load_split("processed_data/val")
+        self.split_sizes = {"train": int(train_files.cardinality()), "val": int(val_files.cardinality())}
+
+        self.train_ds = (
+            train_files
+            .cache("cache/train.tfcache")
+            .shuffle(1000)
+            .batch(batch_size)
+            .map(lambda x, y: (rescale(x), y), num_parallel_calls=AUTOTUNE)
+            .prefetch(AUTOTUNE)
         )
 
-        self.val_generator = val_datagen.flow_from_directory(
-            "processed_data/val",
-            target_size=self.input_shape[:2],
-            batch_size=40,  # increased from 32
-            class_mode="categorical"
+        # Training order is already random, so let parallel maps hand over elements as soon as
+        # any worker finishes instead of waiting on the slowest file
+        options = tf.data.Options()
+        options.deterministic = False
+        self.train_ds = self.train_ds.with_options(options)
+
+        self.val_ds = (
+            val_files
+            .cache("cache/val.tfcache")
+            .batch(batch_size)
+            .map(lambda x, y: (rescale(x), y), num_parallel_calls=AUTOTUNE)
+            .prefetch(AUTOTUNE)
         )
 
-        print("✅ Data generators created successfully!")
+        print("✅ Data pipelines created successfully!")
 
-    def train_model(self, epochs=15):
-        """Train the model"""
+    def train_model(self, use_embeddings=False):
+        """Train the model, optionally only the head on cached base features"""
 
         print("🚀 Starting model training...")
 
@@ -98,34 +210,106 @@ class PestDetectionModel:
             tf.keras.callbacks.EarlyStopping(
                 patience=3, restore_best_weights=True
             ),
-            tf.keras.callbacks.ReduceLROnPlateau(
-                factor=0.2, patience=2, min_lr=0.0001
-            ),
-            tf.keras.callbacks.ModelCheckpoint(
-                "models/best_model.h5",
-                save_best_only=True,
-                monitor="val_accuracy"
-            )
+            # EarlyStopping already keeps the best weights in memory; this is only for crash recovery
+            # Always the full model's weights, also when only the head is fit on embeddings
+            NpzCheckpoint("models/checkpoint.npz", every=2, target=self.model)
         ]
 
+        # Profile batches 20-40 to see whether steps are input-bound or compute-bound
+        # (check the overview page under logs/ in TensorBoard's Profile tab)
+        if self.profile:
+            callbacks.append(tf.keras.callbacks.TensorBoard(log_dir="logs", profile_batch=(20, 40)))
+
         os.makedirs("models", exist_ok=True)
 
         # Train model
-        self.history = self.model.fit(
-            self.train_generator,
-            epochs=epochs,
-            validation_data=self.val_generator,
-            callbacks=callbacks
-        )
+        if use_embeddings:
+            # The head shares its layers with self.model, so the full model is trained too
+            x_train, y_train, x_val, y_val = self.precompute_embeddings()
+            self.history = self.head.fit(
+                x_train, y_train,
+                batch_size=self.batch_size,
+                epochs=self.epochs,
+                validation_data=(x_val, y_val),
+                callbacks=callbacks
+            )
+        else:
+            self.history = self.model.fit(
+                self.train_ds,
+                epochs=self.epochs,
+                validation_data=self.val_ds,
+                callbacks=callbacks
+            )
 
         # Save final model
-        self.model.save("models/pest_detection_model.h5")
+        self.model.save("models/pest_detection_model.keras")
         print("✅ Model training completed!")
 
+        self.export_tflite()
+        self.export_onnx()
+
         self.plot_training_history()
 
+    def precompute_embeddings(self):
+        """Run the frozen base once over both splits and cache pooled features as float16"""
+
+        # The frozen base gives the same features every epoch, so the head can train on them
+        # directly; augmentation is skipped on this path
+        print("🧮 Precomputing base model embeddings...")
+
+        arrays = []
+        for split, ds in (("train", self.train_ds), ("val", self.val_ds)):
+            count = self.split_sizes[split]
+            features = np.lib.format.open_memmap(
+                f"cache/embeddings_{split}.npy", mode="w+", dtype=np.float16,
+                shape=(count, self.feature_extractor.output_shape[-1])
+            )
+            labels = np.empty((count, self.num_classes), dtype=np.float32)
+
+            start = 0
+            for images, batch_labels in ds:
+                end = start + images.shape[0]
+                features[start:end] = self.feature_extractor(images, training=False).numpy()
+                labels[start:end] = batch_labels.numpy()
+                start = end
+
+            features.flush()
+            arrays += [features, labels]
+
+        return arrays
+
+    def export_onnx(self):
+        """Export the trained model to ONNX (FP32 and INT8) for PestDetector"""
+        # Deferred so training does not need tf2onnx to start. Failures propagate: the ONNX
+        # model is the only one PestDetector can load, so training must not report success
+        from export_onnx import export_onnx, quantize_onnx
+
+        export_onnx(model=self.model)
+        quantize_onnx()
+
+    def export_tflite(self, output_path="models/pest_detection_int8.tflite"):
+        """Export a full-integer quantized TFLite model calibrated on validation images"""
+
+        def representative_dataset():
+            for images, _ in self.val_ds.unbatch().take(100):
+                yield [tf.cast(images, tf.float32)[None, ...]]
+
+        converter = tf.lite.TFLiteConverter.from_keras_model(float32_copy(self.model))
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+
+        tflite_model = converter.convert()
+
+        with open(output_path, "wb") as f:
+            f.write(tflite_model)
+        print(f"✅ INT8 TFLite model saved to {output_path}")
+
     def plot_training_history(self):
         """Plot and save training history"""
+        import matplotlib.pyplot as plt  # Only needed once training has finished
+
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
 
         # Accuracy
@@ -146,18 +330,20 @@ class PestDetectionModel:
 
         plt.tight_layout()
         plt.savefig("training_history.png")
-        plt.show()
+        if os.environ.get("DISPLAY"):
+            plt.show()
+        plt.close(fig)
 
         print("📊 Training history saved as 'training_history.png'")
 
 
 if __name__ == "__main__":
     print("[DEBUG] Script started.")
-    model = PestDetectionModel()
+    model = PestDetectionModel(profile="--profile" in sys.argv)
     print("[DEBUG] Model class initialized.")
-    model.create_model()
-    print("[DEBUG] Model created.")
     model.prepare_data()
     print("[DEBUG] Data prepared.")
-    model.train_model(epochs=15)
+    model.create_model()
+    print("[DEBUG] Model created.")
+    model.train_model(use_embeddings="--embeddings" in sys.argv)
     print("[DEBUG] Training complete.")